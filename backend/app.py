@@ -40,6 +40,7 @@ image = (
     )
     .pip_install_from_requirements("backend/requirements.txt")
     .add_local_file("backend/triposr_pipeline.py", "/root/triposr_pipeline.py")
+    .add_local_file("backend/triposr_model.py", "/root/triposr_model.py")
     .add_local_file("backend/background_removal.py", "/root/background_removal.py")
     .add_local_dir("backend/img", "/root/img")
 )
@@ -1,12 +1,106 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+PHOTOROOM_SEGMENT_URL = 'https://sdk.photoroom.com/v1/segment'
+
+# Number of images uploaded to Photoroom at once (overridable via env)
+DEFAULT_CONCURRENCY = 8
+
+
+def _read_concurrency() -> int:
+    """Read PHOTOROOM_CONCURRENCY, falling back to the default when it is unset or invalid"""
+    try:
+        return max(1, int(os.environ.get("PHOTOROOM_CONCURRENCY", DEFAULT_CONCURRENCY)))
+    except ValueError:
+        return DEFAULT_CONCURRENCY
+
+
+# Process-wide limit on uploads in flight. Concurrent requests share it, so the
+# session's connection pool (sized to match) is never exceeded.
+CONCURRENCY = _read_concurrency()
+_upload_slots = threading.BoundedSemaphore(CONCURRENCY)
+
+# Longest we wait on a Retry-After header before retrying. Together with the retry
+# count this keeps a struggling image well inside process_images' timeout, so it is
+# reported as failed instead of the whole call being killed.
+MAX_RETRY_AFTER = 10.0
+
+# Results cached by input content are evicted, least recently used first, beyond this size
+MASK_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+class _CappedRetry(Retry):
+    """Retry policy that honours Retry-After but never sleeps longer than MAX_RETRY_AFTER"""
+    
+    def get_retry_after(self, response) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, MAX_RETRY_AFTER)
+
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide Photoroom session
+    
+    Shared across requests so a warm container keeps its pooled keep-alive
+    connections to Photoroom instead of paying a TLS handshake per image.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            # Retry rate limiting and transient server errors, honouring (capped) Retry-After on 429/503.
+            # POST is safe to retry here: segmentation has no side effects on Photoroom's end.
+            retry = _CappedRetry(
+                total=2,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {"POST"},
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_maxsize=CONCURRENCY, max_retries=retry)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def _link_into_place(src: Path, dst: Path) -> None:
+    """Atomically make dst a hardlink to src (or a copy across filesystems)"""
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    try:
+        os.replace(tmp, dst)
+    except OSError:
+        os.unlink(tmp)
+        raise
+
+
+class PhotoroomAPIError(RuntimeError):
+    """Raised when the Photoroom API rejects a request"""
 
 
 class BackgroundRemover:
     """Handles background removal using Photoroom API"""
     
-    def __init__(self, input_dir: Path, output_dir: Path, verbose: bool = True):
+    def __init__(self, input_dir: Path, output_dir: Path, verbose: bool = True,
+                 cache_dir: Optional[Path] = None):
         """
         Initialize the background remover
         
@@ -14,36 +108,49 @@ class BackgroundRemover:
             input_dir: Directory containing images to process
             output_dir: Directory where processed images will be saved
             verbose: Whether to print progress messages
+            cache_dir: Optional directory of results keyed by input content, shared
+                across output directories so a retry only re-uploads what failed
         """
         self.input_dir = Path(input_dir)
         self.output_dir = Path(output_dir)
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
         self.verbose = verbose
         
-        # Create output directory if it doesn't exist
+        # Create output directories if they don't exist
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
     
     def log(self, message: str):
         """Print message if verbose mode is on"""
         if self.verbose:
             print(message)
     
-    def remove_backgrounds(self, photoroom_api_key: str, image_format: str = "png") -> dict:
+    def remove_backgrounds(self, photoroom_api_key: str, image_format: str = "png",
+                           force: bool = False, image_paths: Optional[List[Path]] = None) -> dict:
         """
-        Remove backgrounds from all images in input directory using Photoroom API
+        Remove backgrounds from images using Photoroom API
         
         Args:
             photoroom_api_key: Photoroom API key for authentication
             image_format: Output format ('png' or 'jpg')
+            force: Re-process images even if an up-to-date output already exists
+            image_paths: Images to process, in order (defaults to all images in input directory)
         
         Returns:
-            dict: Results containing success status, processed count, failed count, and total
+            dict: Results containing success status, processed count, failed count, total,
+                and the output paths of successfully processed images in input order
         """
         self.log("\nRemoving backgrounds with Photoroom API...")
         
-        # Find all images in input directory
-        image_files = sorted(self.input_dir.glob("*.jpg"))
-        image_files.extend(sorted(self.input_dir.glob("*.jpeg")))
-        image_files.extend(sorted(self.input_dir.glob("*.png")))
+        if image_paths is not None:
+            image_files = [Path(p) for p in image_paths]
+        else:
+            # Find all images in input directory
+            image_files = sorted(self.input_dir.glob("*.jpg"))
+            image_files.extend(sorted(self.input_dir.glob("*.jpeg")))
+            image_files.extend(sorted(self.input_dir.glob("*.png")))
+            image_files.extend(sorted(self.input_dir.glob("*.webp")))
         
         if not image_files:
             return {
@@ -51,101 +158,228 @@ class BackgroundRemover:
                 "error": "No images found to process",
                 "processed": 0,
                 "failed": 0,
-                "total": 0
+                "total": 0,
+                "outputs": []
             }
         
-        processed = 0
-        failed = 0
+        output_extension = '.png' if image_format == 'png' else '.jpg'
+        cache_keys = {}
+        if self.cache_dir is not None:
+            cache_keys = {p: self._cache_key(p, image_format) for p in image_files}
+        pending = image_files
+        if not force:
+            pending = [
+                p for p in image_files
+                if not self._is_up_to_date(p, self.output_dir / f"{p.stem}{output_extension}")
+                and not self._restore_cached(cache_keys.get(p), output_extension,
+                                             self.output_dir / f"{p.stem}{output_extension}")
+            ]
+            skipped = len(image_files) - len(pending)
+            if skipped:
+                self.log(f"  - Skipped {skipped} cached image(s)")
         
-        for i, img_path in enumerate(image_files):
-            self.log(f"  - Processing {img_path.name} ({i+1}/{len(image_files)})")
-            
-            try:
-                with open(img_path, 'rb') as f:
-                    response = requests.post(
-                        'https://sdk.photoroom.com/v1/segment',
-                        headers={'x-api-key': photoroom_api_key},
-                        files={'image_file': f},
-                        data={
-                            'format': image_format,
-                            'channels': 'rgba'
-                        },
-                        timeout=30
-                    )
-                
-                if response.status_code == 200:
-                    # Save with appropriate extension
-                    output_extension = '.png' if image_format == 'png' else '.jpg'
-                    output_path = self.output_dir / f"{img_path.stem}{output_extension}"
-                    output_path.write_bytes(response.content)
+        processed = len(image_files) - len(pending)
+        failed_inputs = set()
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(CONCURRENCY, len(pending)))) as executor:
+            futures = {
+                executor.submit(self.remove_one, img_path, photoroom_api_key, image_format): img_path
+                for img_path in pending
+            }
+            for i, future in enumerate(as_completed(futures)):
+                img_path = futures[future]
+                try:
+                    output_path = future.result()
                     processed += 1
-                else:
-                    self.log(f"    ✗ Failed: {response.status_code} - {response.text[:100]}")
-                    failed += 1
-                    
-            except Exception as e:
-                self.log(f"    ✗ Error: {str(e)}")
-                failed += 1
+                    self.log(f"  - Processed {img_path.name} ({i+1}/{len(pending)})")
+                    if img_path in cache_keys:
+                        self._store_cached(cache_keys[img_path], output_extension, output_path)
+                except PhotoroomAPIError as e:
+                    self.log(f"  ✗ {img_path.name} ({i+1}/{len(pending)}): {e}")
+                    failed_inputs.add(img_path)
+                except Exception as e:
+                    self.log(f"  ✗ {img_path.name} ({i+1}/{len(pending)}): Error: {str(e)}")
+                    failed_inputs.add(img_path)
         
+        if self.cache_dir is not None and processed > len(image_files) - len(pending):
+            self._evict_cache()
+        
+        failed = len(failed_inputs)
         self.log(f"✓ Background removal complete: {processed} succeeded, {failed} failed\n")
         
+        outputs = [
+            str(self.output_dir / f"{p.stem}{output_extension}")
+            for p in image_files if p not in failed_inputs
+        ]
         return {
             "success": failed == 0,
             "processed": processed,
             "failed": failed,
-            "total": len(image_files)
+            "total": len(image_files),
+            "outputs": outputs
         }
     
-    def remove_background_single(self, image_path: Path, photoroom_api_key: str, 
-                                 output_path: Optional[Path] = None, 
-                                 image_format: str = "png") -> dict:
+    @staticmethod
+    def _is_up_to_date(input_path: Path, output_path: Path) -> bool:
         """
-        Remove background from a single image
+        Check whether output_path holds a result for the current input_path
+        
+        The output must be non-empty and at least as new as the input, so a
+        re-uploaded image with the same name is processed again.
+        """
+        try:
+            out_stat = output_path.stat()
+        except FileNotFoundError:
+            return False
+        return out_stat.st_size > 0 and out_stat.st_mtime >= input_path.stat().st_mtime
+    
+    @staticmethod
+    def _cache_key(image_path: Path, image_format: str) -> str:
+        """Hash an input image's content together with the requested output format"""
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{image_format}|rgba|".encode())
+        with open(image_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+    
+    def _restore_cached(self, key: Optional[str], extension: str, output_path: Path) -> bool:
+        """Link a cached result for key to output_path; returns False on a miss"""
+        if key is None:
+            return False
+        cached = self.cache_dir / f"{key}{extension}"
+        try:
+            _link_into_place(cached, output_path)
+            # Mark as recently used for eviction
+            os.utime(cached)
+        except FileNotFoundError:
+            return False
+        return True
+    
+    def _store_cached(self, key: str, extension: str, output_path: Path) -> None:
+        """Add a finished result to the cache; failures only cost a future re-upload"""
+        try:
+            _link_into_place(output_path, self.cache_dir / f"{key}{extension}")
+        except OSError as e:
+            self.log(f"    Warning: Could not cache {output_path.name}: {e}")
+    
+    def _evict_cache(self) -> None:
+        """Remove least recently used cached results until the cache fits in MASK_CACHE_MAX_BYTES"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith('.'):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= MASK_CACHE_MAX_BYTES:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+    
+    def remove_one(self, image_path: Path, photoroom_api_key: str, image_format: str = "png",
+                   output_path: Optional[Path] = None) -> Path:
+        """
+        Upload one image to Photoroom and save the result
         
         Args:
             image_path: Path to the image to process
             photoroom_api_key: Photoroom API key for authentication
-            output_path: Optional custom output path (defaults to output_dir)
             image_format: Output format ('png' or 'jpg')
+            output_path: Optional custom output path (defaults to output_dir)
         
         Returns:
-            dict: Results containing success status and output path
-        """
-        self.log(f"Processing single image: {image_path.name}")
+            Path: Where the processed image was written
         
-        try:
+        Raises:
+            PhotoroomAPIError: If the API answers with a non-200 status
+        """
+        # Hold a slot (and so a pooled connection) until the response body is consumed
+        with _upload_slots:
             with open(image_path, 'rb') as f:
-                response = requests.post(
-                    'https://sdk.photoroom.com/v1/segment',
+                response = get_session().post(
+                    PHOTOROOM_SEGMENT_URL,
                     headers={'x-api-key': photoroom_api_key},
                     files={'image_file': f},
                     data={
                         'format': image_format,
                         'channels': 'rgba'
                     },
-                    timeout=30
+                    timeout=(5, 30),
+                    stream=True
                 )
             
-            if response.status_code == 200:
-                # Determine output path
+            with response:
+                if response.status_code != 200:
+                    raise PhotoroomAPIError(f"API error: {response.status_code} - {response.text[:100]}")
+                
                 if output_path is None:
+                    # Save with appropriate extension
                     output_extension = '.png' if image_format == 'png' else '.jpg'
                     output_path = self.output_dir / f"{image_path.stem}{output_extension}"
-                
-                output_path.write_bytes(response.content)
-                self.log(f"✓ Saved to {output_path}")
-                
-                return {
-                    "success": True,
-                    "output_path": str(output_path)
-                }
-            else:
-                error_msg = f"API error: {response.status_code} - {response.text[:100]}"
-                self.log(f"✗ {error_msg}")
-                return {
-                    "success": False,
-                    "error": error_msg
-                }
+                self._write_response(response, output_path)
+        return output_path
+    
+    @staticmethod
+    def _write_response(response: requests.Response, output_path: Path) -> None:
+        """
+        Stream a response body to disk without buffering it in memory
+        
+        The body goes to a temporary file next to output_path and is renamed into
+        place once complete, so an interrupted download never leaves a truncated
+        file that _is_up_to_date would accept.
+        """
+        response.raw.decode_content = True
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{output_path.name}.", suffix=".part",
+                                        dir=output_path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                shutil.copyfileobj(response.raw, out, length=1 << 20)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    
+    def remove_background_single(self, image_path: Path, photoroom_api_key: str, 
+                                 output_path: Optional[Path] = None, 
+                                 image_format: str = "png") -> dict:
+        """
+        Remove background from a single image
+        
+        Args:
+            image_path: Path to the image to process
+            photoroom_api_key: Photoroom API key for authentication
+            output_path: Optional custom output path (defaults to output_dir)
+            image_format: Output format ('png' or 'jpg')
+        
+        Returns:
+            dict: Results containing success status and output path
+        """
+        self.log(f"Processing single image: {image_path.name}")
+        
+        try:
+            output_path = self.remove_one(image_path, photoroom_api_key, image_format, output_path)
+            self.log(f"✓ Saved to {output_path}")
+            
+            return {
+                "success": True,
+                "output_path": str(output_path)
+            }
+        
+        except PhotoroomAPIError as e:
+            error_msg = str(e)
+            self.log(f"✗ {error_msg}")
+            return {
+                "success": False,
+                "error": error_msg
+            }
                 
         except Exception as e:
             error_msg = f"Processing error: {str(e)}"
@@ -154,4 +388,3 @@ class BackgroundRemover:
                 "success": False,
                 "error": error_msg
             }
-
@@ -0,0 +1,64 @@
+"""Load TripoSR once and run reconstructions on the resident model.
+
+Reconstruction mirrors TripoSR's run.py with its default options (no texture baking),
+writing <output_dir>/<i>/input.png and <output_dir>/<i>/mesh.<format> per image.
+Used by TripoSRPipeline when the model runs in-process; run.py is the fallback.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import List
+
+
+def load_model(device: str):
+    import torch
+    from PIL import Image
+    from tsr.system import TSR
+
+    # Inputs are always resized to the same shape, so let cuDNN pick the fastest kernels once
+    torch.backends.cudnn.benchmark = True
+
+    model = TSR.from_pretrained(
+        "stabilityai/TripoSR",
+        config_name="config.yaml",
+        weight_name="model.ckpt",
+    )
+    model.renderer.set_chunk_size(8192)
+    model.to(device)
+
+    # Warm-up pass so the first real request doesn't pay for autotuning and allocator growth
+    with torch.no_grad():
+        model([Image.new("RGB", (512, 512), (127, 127, 127))], device=device)
+    return model
+
+
+def reconstruct(model, device: str, rembg_session, images: List[str], output_dir: str,
+                model_save_format: str = "glb") -> List[str]:
+    import numpy as np
+    import torch
+    from PIL import Image
+    from tsr.utils import remove_background, resize_foreground
+
+    files: List[str] = []
+    for i, image_path in enumerate(images):
+        out_dir = Path(output_dir) / str(i)
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        # Same preprocessing as run.py: cut out, recenter, composite on grey
+        image = remove_background(Image.open(image_path), rembg_session)
+        image = resize_foreground(image, 0.85)
+        arr = np.array(image).astype(np.float32) / 255.0
+        arr = arr[:, :, :3] * arr[:, :, 3:4] + (1 - arr[:, :, 3:4]) * 0.5
+        image = Image.fromarray((arr * 255.0).astype(np.uint8))
+        input_path = out_dir / "input.png"
+        image.save(input_path)
+
+        with torch.no_grad():
+            scene_codes = model([image], device=device)
+        meshes = model.extract_mesh(scene_codes, True, resolution=256)
+        mesh_path = out_dir / f"mesh.{model_save_format}"
+        meshes[0].export(str(mesh_path))
+
+        files.extend([str(input_path), str(mesh_path)])
+    return files
@@ -1,165 +1,473 @@
 from __future__ import annotations
 
+import atexit
+import hashlib
+import json
 import os
+import shutil
 import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from background_removal import BackgroundRemover
+from triposr_model import load_model, reconstruct
+
+try:
+    import pillow_heif
+except ImportError:
+    pillow_heif = None
+
+# Longest edge kept for uploaded images. TripoSR conditions on 512px crops, so
+# larger inputs only cost decode time here, in Photoroom and in TripoSR.
+MAX_IMAGE_SIZE = 1024
+
+# Virtual X display used by TripoSR's OpenGL texture baking
+XVFB_DISPLAY = ":99"
+XVFB_SOCKET = Path("/tmp/.X11-unix/X99")
+XVFB_LOCK = Path("/tmp/.X99-lock")
+# Resolved once: the binary does not appear or disappear in a running container
+_HAS_XVFB = shutil.which("Xvfb") is not None
+
+# Seconds to wait before retrying an in-process model load that failed for a reason other than a missing import
+MODEL_RETRY_DELAY = 60
+
+# Bump when TripoSR settings change so stale cached meshes are not served
+CACHE_VERSION = "triposr-glb-mc256-v3"
+# Per-entry manifest: published files, their total size, and the run's background removal summary
+CACHE_META = "result.json"
+# Least recently used cache entries are evicted beyond this total size
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Per-run input and output dirs kept in work_dir (newest first); older ones are pruned
+KEEP_RUNS = 8
+# Never prune a dir younger than process_images' timeout: its request may still be using it
+RUN_DIR_MIN_AGE = 5 * 60
+
+
+def _sniff_extension(data: bytes) -> Optional[str]:
+    """Return the file extension for JPEG/PNG/WebP data based on its magic bytes."""
+    if data[:3] == b"\xff\xd8\xff":
+        return ".jpg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return ".png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+# Entrypoints found so far, keyed by TripoSR dir. Misses are not stored, so a
+# checkout that appears later is still picked up.
+_entrypoints: Dict[Path, Path] = {}
+
+
+def find_triposr_entrypoint(triposr_dir: Path) -> Optional[Path]:
+    """Best-effort search for TripoSR CLI within container or local environment."""
+    if triposr_dir in _entrypoints:
+        return _entrypoints[triposr_dir]
+    candidates = [
+        triposr_dir / "run.py",
+        triposr_dir / "scripts" / "run.py",
+        triposr_dir / "inference" / "run.py",
+    ]
+    for c in candidates:
+        if c.exists():
+            _entrypoints[triposr_dir] = c
+            return c
+    return None
+
+
+def _convert_heic(data: bytes, img_path: Path) -> None:
+    """Decode HEIC through libheif directly and save it as a downscaled, fast PNG."""
+    from PIL import Image
+
+    if pillow_heif is None:
+        raise ImportError("pillow_heif is not installed")
+    img = pillow_heif.open_heif(data, convert_hdr_to_8bit=True).to_pillow()
+    img.thumbnail((MAX_IMAGE_SIZE, MAX_IMAGE_SIZE), Image.LANCZOS)
+    img.save(img_path, "PNG", compress_level=1)
+
+
+def _list_files(root: Path) -> List[Path]:
+    """Recursively list regular files under root, using scandir's cached entry types."""
+    files: List[Path] = []
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return files
+    for entry in sorted(entries, key=lambda e: e.name):
+        if entry.is_file(follow_symlinks=False):
+            files.append(Path(entry.path))
+        elif entry.is_dir(follow_symlinks=False):
+            files.extend(_list_files(Path(entry.path)))
+    return files
+
+
+def _dir_size(root: Path) -> int:
+    """Total size of the regular files under root."""
+    total = 0
+    for path in _list_files(root):
+        try:
+            total += path.stat().st_size
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def _prune_dirs(parent: Path, prefixes: Tuple[str, ...], keep: int) -> None:
+    """Remove all but the newest ``keep`` subdirs of parent whose name starts with one of prefixes.
+
+    Dirs younger than RUN_DIR_MIN_AGE are always kept, so in-flight requests are never affected.
+    """
+    try:
+        entries = [e for e in os.scandir(parent) if e.name.startswith(prefixes) and e.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
+        return
+    dirs = []
+    for entry in entries:
+        try:
+            dirs.append((entry.stat(follow_symlinks=False).st_mtime, entry.path))
+        except FileNotFoundError:
+            pass
+    dirs.sort(reverse=True)
+    cutoff = time.time() - RUN_DIR_MIN_AGE
+    for mtime, path in dirs[keep:]:
+        if mtime < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    """Hardlink src to dst (no data copied), falling back to a copy across filesystems."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+# ISO-BMFF major brands used by HEIF/HEIC stills and sequences (iPhones commonly write mif1/msf1)
+HEIF_BRANDS = (b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"mif1", b"msf1")
+
+
+def _is_heif(data: bytes) -> bool:
+    """HEIF/HEIC files start with an ``ftyp`` box naming a HEIF brand."""
+    return data[4:8] == b"ftyp" and data[8:12] in HEIF_BRANDS
 
 
 class TripoSRPipeline:
     """Minimal pipeline: save images → optional BG removal → run TripoSR → return outputs."""
 
-    def __init__(self, work_dir: Path, verbose: bool = True):
+    # One Xvfb server per process, shared by every pipeline instance
+    _xvfb_proc: Optional[subprocess.Popen] = None
+    _xvfb_lock = threading.Lock()
+
+    # TripoSR model loaded into this process: (model, device, rembg session)
+    _model: Optional[tuple] = None
+    _model_error: Optional[str] = None
+    _model_retry_at = 0.0
+    _model_lock = threading.Lock()
+    _inference_lock = threading.Lock()
+
+    def __init__(self, work_dir: Path, verbose: bool = True, in_process: bool = True):
         self.work_dir = Path(work_dir)
-        self.img_dir = self.work_dir / "images"
-        self.masked_dir = self.work_dir / "masked"
+        self.inputs_dir = self.work_dir / "inputs"
         self.output_dir = self.work_dir / "triposr_output"
+        self.scratch_dir = self.work_dir / "scratch"
+        self.cache_dir = self.work_dir.parent / "triposr_cache"
+        # Photoroom results by input content, so a retry after a partial failure only re-uploads what failed
+        self.mask_cache_dir = self.work_dir.parent / "photoroom_cache"
         self.verbose = verbose
+        self.in_process = in_process
+        # Allow override via env var
+        self.triposr_dir = Path(os.environ.get("TRIPOSR_DIR", "/root/TripoSR")).resolve()
+        self.entry = find_triposr_entrypoint(self.triposr_dir)
+
+        # work_dir is shared by concurrent requests; give each pipeline its own images/ and
+        # masked/ so one request can never reconstruct (and cache) another's uploads
+        self.inputs_dir.mkdir(parents=True, exist_ok=True)
+        run_inputs = Path(tempfile.mkdtemp(prefix="run_", dir=self.inputs_dir))
+        self.img_dir = run_inputs / "images"
+        self.masked_dir = run_inputs / "masked"
 
-        for d in [self.img_dir, self.masked_dir, self.output_dir]:
+        for d in [self.img_dir, self.masked_dir, self.output_dir, self.scratch_dir]:
             d.mkdir(parents=True, exist_ok=True)
 
+        if self.in_process:
+            self._load_model()
+
     def log(self, message: str) -> None:
         if self.verbose:
             print(message)
 
     def save_images(self, image_data: List[bytes]) -> List[Path]:
-        import imghdr
-        from PIL import Image
-        import io
-        
         self.log(f"Saving {len(image_data)} image(s)...")
-        saved: List[Path] = []
         
-        for i, data in enumerate(image_data):
-            # Try to detect format
-            kind = imghdr.what(None, h=data)
-            
-            # Check if it might be HEIC (imghdr doesn't detect HEIC)
-            if kind is None and (data[:4] == b'ftyp' or data[4:12] == b'ftypheic' or data[4:12] == b'ftypheix'):
-                # Convert HEIC to JPEG
-                try:
-                    from pillow_heif import register_heif_opener
-                    register_heif_opener()
-                    
-                    img = Image.open(io.BytesIO(data))
-                    img_path = self.img_dir / f"image_{i:03d}.jpg"
-                    img.save(img_path, "JPEG", quality=95)
-                    saved.append(img_path)
-                    self.log(f"  Converted HEIC to JPEG: {img_path.name}")
-                    continue
-                except Exception as e:
-                    self.log(f"  Warning: Could not convert HEIC: {e}")
-                    kind = "jpeg"  # fallback
-            
-            # Handle standard formats
-            ext = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}.get(kind or "jpeg", ".jpg")
-            img_path = self.img_dir / f"image_{i:03d}{ext}"
-            img_path.write_bytes(data)
-            saved.append(img_path)
+        # Decoding/encoding and disk writes are independent per image; run them concurrently
+        workers = max(1, min(16, (os.cpu_count() or 1) * 2, len(image_data)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(self._save_image, range(len(image_data)), image_data))
+        saved: List[Path] = [p for p in results if p is not None]
             
         self.log(f"✓ Saved {len(saved)} image(s) to {self.img_dir}")
         return saved
 
+    def _save_image(self, i: int, data: bytes) -> Optional[Path]:
+        """Save one upload; returns None (and logs) if its format is not supported."""
+        # Try to detect format
+        ext = _sniff_extension(data)
+        
+        # Check if it might be HEIC
+        if ext is None and _is_heif(data):
+            # Convert HEIC to a fast, lossless PNG rather than paying for a JPEG encode
+            try:
+                img_path = self.img_dir / f"image_{i:03d}.png"
+                _convert_heic(data, img_path)
+                self.log(f"  Converted HEIC to PNG: {img_path.name}")
+                return img_path
+            except Exception as e:
+                self.log(f"  Skipping image {i}: could not convert HEIC: {e}")
+                return None
+        
+        if ext is None:
+            # Anything else Pillow can decode (BMP, GIF, TIFF, ...) is normalised to PNG
+            img_path = self.img_dir / f"image_{i:03d}.png"
+            if self._write_downscaled(data, img_path, convert=True):
+                return img_path
+            self.log(f"  Skipping image {i}: unsupported format (header {data[:12]!r})")
+            return None
+        
+        # Handle standard formats
+        img_path = self.img_dir / f"image_{i:03d}{ext}"
+        if self._write_downscaled(data, img_path.with_suffix(".png")):
+            return img_path.with_suffix(".png")
+        img_path.write_bytes(data)
+        return img_path
+
+    def _write_downscaled(self, data: bytes, img_path: Path, convert: bool = False) -> bool:
+        """
+        Write images larger than MAX_IMAGE_SIZE to img_path as a downscaled PNG.
+
+        Returns False (writing nothing) when the image is already small enough or
+        cannot be decoded, so the caller can store the original bytes untouched.
+        With convert=True the image is written as PNG whatever its size, and False
+        only means it could not be decoded.
+        """
+        from PIL import Image, ImageOps
+        import io
+
+        try:
+            img = Image.open(io.BytesIO(data))
+            if max(img.size) <= MAX_IMAGE_SIZE and not convert:
+                return False
+            fmt = img.format
+            # Let libjpeg decode at a reduced DCT scale when it can (no-op for other formats)
+            img.draft(img.mode, (MAX_IMAGE_SIZE, MAX_IMAGE_SIZE))
+            # Bake EXIF rotation in before the metadata is dropped by re-encoding
+            img = ImageOps.exif_transpose(img)
+            # Resample in a plain colour mode: PNG cannot store CMYK, and palette images resize poorly
+            if img.mode not in ("RGB", "RGBA", "L", "LA"):
+                has_alpha = "A" in img.getbands() or "transparency" in img.info
+                img = img.convert("RGBA" if has_alpha else "RGB")
+            img.thumbnail((MAX_IMAGE_SIZE, MAX_IMAGE_SIZE), Image.LANCZOS)
+            # Lossless, so no new compression artifacts reach the reconstruction network
+            img.save(img_path, "PNG", compress_level=1)
+            self.log(f"  Saved {fmt} input as {img.size[0]}x{img.size[1]} PNG: {img_path.name}")
+            return True
+        except Exception as e:
+            self.log(f"  Warning: Could not decode image: {e}")
+            return False
+
     def remove_backgrounds(self, api_key: Optional[str], image_paths: List[Path]) -> Tuple[List[Path], Optional[dict]]:
         if not api_key:
             self.log("Background removal skipped (no API key).")
             return image_paths, None
 
         self.log("Removing backgrounds via Photoroom API...")
-        remover = BackgroundRemover(self.img_dir, self.masked_dir, verbose=self.verbose)
-        result = remover.remove_backgrounds(api_key, image_format="png")
+        remover = BackgroundRemover(self.img_dir, self.masked_dir, verbose=self.verbose,
+                                    cache_dir=self.mask_cache_dir)
+        result = remover.remove_backgrounds(api_key, image_format="png", image_paths=image_paths)
 
-        # Collect masked outputs; fall back to originals if none produced
-        masked = sorted(self.masked_dir.glob("*.png"))
-        if not masked:
+        # Pair each input with its mask by name, keeping input order; fall back to originals if none produced
+        outputs = {Path(p).stem: Path(p) for p in result.get("outputs", [])}
+        if not outputs:
             self.log("No masked images produced; falling back to original inputs.")
             return image_paths, result
+        # Inputs whose removal failed keep their original image (TripoSR removes backgrounds itself)
+        masked = [outputs.get(p.stem, p) for p in image_paths]
         return masked, result
 
-    def _find_triposr_entrypoint(self) -> Optional[Path]:
-        """Best-effort search for TripoSR CLI within container or local environment."""
-        # Allow override via env var
-        base = Path(os.environ.get("TRIPOSR_DIR", "/root/TripoSR")).resolve()
-        candidates = [
-            base / "run.py",
-            base / "scripts" / "run.py",
-            base / "inference" / "run.py",
-        ]
-        for c in candidates:
-            if c.exists():
-                return c
-        return None
+    @classmethod
+    def _ensure_xvfb(cls, timeout: float = 2.0) -> bool:
+        """Start the shared Xvfb display on first use; returns whether it is running."""
+        with cls._xvfb_lock:
+            if cls._xvfb_proc is not None and cls._xvfb_proc.poll() is None:
+                return True
+            if not _HAS_XVFB:
+                return False
+
+            proc = subprocess.Popen(
+                ["Xvfb", XVFB_DISPLAY, "-screen", "0", "1024x768x24"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            atexit.register(proc.terminate)
+            cls._xvfb_proc = proc
+
+            # Ready once the server has taken its lock and created the display socket;
+            # stop waiting early if it exits (e.g. the display is already in use)
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline and proc.poll() is None:
+                if XVFB_LOCK.exists() and XVFB_SOCKET.exists():
+                    return True
+                time.sleep(0.005)
+            return proc.poll() is None
+
+    def _load_model(self) -> Optional[tuple]:
+        """Load TripoSR into this process on first use; returns None if it is unavailable."""
+        cls = type(self)
+        with cls._model_lock:
+            if cls._model is None and cls._model_error is None and time.monotonic() >= cls._model_retry_at:
+                self.log("Loading TripoSR model...")
+                try:
+                    if str(self.triposr_dir) not in sys.path:
+                        sys.path.insert(0, str(self.triposr_dir))
+                    # Read by the CUDA caching allocator on first use; avoids fragmentation
+                    # as input sizes vary across requests
+                    os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
+                    import rembg
+                    import torch
+
+                    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+                    cls._model = (load_model(device), device, rembg.new_session())
+                except ImportError as e:
+                    # Missing packages won't appear in a running container; stop trying
+                    cls._model_error = f"{type(e).__name__}: {e}"
+                    self.log(f"Could not load TripoSR in-process ({cls._model_error}); using subprocess.")
+                except Exception as e:
+                    # Likely transient (e.g. a failed weight download); try again later
+                    cls._model_retry_at = time.monotonic() + MODEL_RETRY_DELAY
+                    self.log(f"Could not load TripoSR in-process ({type(e).__name__}: {e}); "
+                             f"using subprocess, retrying in {MODEL_RETRY_DELAY}s.")
+            return cls._model
+
+    def _run_in_process(self, input_images: List[Path], out_dir: Path) -> Optional[dict]:
+        """Run TripoSR on the resident model; returns None if it is unavailable."""
+        runtime = self._load_model()
+        if runtime is None:
+            return None
+
+        model, device, rembg_session = runtime
+        try:
+            # One reconstruction at a time on the shared model
+            with type(self)._inference_lock:
+                files = reconstruct(
+                    model,
+                    device,
+                    rembg_session,
+                    [str(p) for p in input_images],
+                    str(out_dir),
+                    "glb",
+                )
+        except Exception as e:
+            return {"success": False, "error": f"{type(e).__name__}: {e}"}
+        return {
+            "success": True,
+            "output_dir": str(out_dir),
+            "files": files,
+        }
 
     def run_triposr(self, input_images: List[Path]) -> dict:
         if not input_images:
             return {"success": False, "error": "No input images provided to TripoSR"}
 
-        entry = self._find_triposr_entrypoint()
-        if not entry:
+        if not self.entry:
             return {
                 "success": False,
                 "error": "TripoSR entrypoint not found. Ensure the repo is available in TRIPOSR_DIR or /root/TripoSR.",
             }
 
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.scratch_dir.mkdir(parents=True, exist_ok=True)
+        self.log("Running TripoSR (this uses GPU if available)...")
+
+        # Build into a scratch dir and rename it into place on success, so a crashed
+        # or failed run never leaves partial outputs under output_dir
+        tmp_dir = Path(tempfile.mkdtemp(prefix="triposr_", dir=self.scratch_dir))
+        try:
+            result = self._run_triposr(input_images, tmp_dir)
+            if not result.get("success"):
+                return result
+
+            run_dir = self.output_dir / tmp_dir.name
+            files = [str(run_dir / Path(f).relative_to(tmp_dir)) for f in result["files"]]
+            os.replace(tmp_dir, run_dir)
+        finally:
+            # Gone already if it was published; otherwise discard whatever the run left behind
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        result["output_dir"] = str(run_dir)
+        result["files"] = files
+        return result
+
+    def _run_triposr(self, input_images: List[Path], out_dir: Path) -> dict:
+        """Reconstruct into out_dir on the resident model, falling back to the run.py CLI."""
+        if self.in_process:
+            model_result = self._run_in_process(input_images, out_dir)
+            if model_result is not None:
+                return model_result
+
+        # Set up environment for headless OpenGL rendering on the shared display
+        env = os.environ.copy()
+        if self._ensure_xvfb():
+            env["DISPLAY"] = XVFB_DISPLAY
+        # The CPU side of TripoSR is light preprocessing; keep OpenMP/MKL from spinning
+        # up a thread per core next to the GPU work (explicit settings still win)
+        env.setdefault("OMP_NUM_THREADS", "2")
+        env.setdefault("MKL_NUM_THREADS", "2")
+
+        # One-shot fallback: run TripoSR's own CLI in a fresh process
         cmd = [
             "python",
-            str(entry),
+            str(self.entry),
             *[str(p) for p in input_images],
             "--output-dir",
-            str(self.output_dir),
+            str(out_dir),
+            # Binary glTF is several times smaller and faster to write than OBJ
+            "--model-save-format",
+            "glb",
             # Skip texture baking for now due to CPU/GPU device mismatch in TripoSR
-            # The mesh (.obj) will still be generated successfully
+            # The mesh (.glb) will still be generated successfully
             # "--bake-texture",
         ]
 
-        self.log("Running TripoSR (this uses GPU if available)...")
-        try:
-            # Set up environment for headless OpenGL rendering
-            env = os.environ.copy()
-            env["DISPLAY"] = ":99"
-            
-            # Start Xvfb virtual display in background
-            xvfb_proc = subprocess.Popen(
-                ["Xvfb", ":99", "-screen", "0", "1024x768x24"],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-            
-            try:
-                # Give Xvfb time to start (reduced from 0.5s to 0.2s)
-                import time
-                time.sleep(0.2)
-                
-                result = subprocess.run(
-                    cmd,
-                    check=True,
-                    capture_output=True,
-                    text=True,
-                    env=env,
-                )
-            finally:
-                # Clean up Xvfb
-                xvfb_proc.terminate()
-                xvfb_proc.wait(timeout=2)
-            if self.verbose:
-                # Truncate logs to last lines
-                tail = "\n".join(result.stdout.splitlines()[-20:])
-                if tail.strip():
-                    self.log(tail)
-        except subprocess.CalledProcessError as e:
-            return {"success": False, "error": e.stderr or str(e)}
-
-        # Collect outputs (common outputs: .obj/.mtl/.png or .glb)
-        produced = sorted(self.output_dir.glob("**/*"))
-        files = [str(p) for p in produced if p.is_file()]
+        # Log the combined output as it arrives and keep only a tail for error reporting
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+            bufsize=1,
+            env=env,
+        )
+        tail: deque = deque(maxlen=20)
+        for line in proc.stdout:
+            tail.append(line)
+            if line.strip():
+                self.log(line.rstrip())
+        returncode = proc.wait()
+        if returncode != 0:
+            return {"success": False, "error": "".join(tail) or f"TripoSR exited with status {returncode}"}
+
+        # Collect outputs (<i>/mesh.glb plus the processed <i>/input.png); out_dir is
+        # private to this run, so everything in it was just produced
         return {
             "success": True,
-            "output_dir": str(self.output_dir),
-            "files": files,
+            "output_dir": str(out_dir),
+            "files": [str(p) for p in _list_files(out_dir)],
         }
 
     def run(self, image_data: List[bytes], photoroom_api_key: Optional[str] = None) -> dict:
@@ -169,13 +477,44 @@ class TripoSRPipeline:
         if len(image_data) > 5:
             image_data = image_data[:5]
 
+        try:
+            return self._run(image_data, photoroom_api_key)
+        finally:
+            self._prune()
+
+    def _run(self, image_data: List[bytes], photoroom_api_key: Optional[str]) -> dict:
+        cache_key = self._cache_key(image_data, bool(photoroom_api_key))
+        cached = self._load_cached(cache_key)
+        if cached is not None:
+            cached_result, cached_bg_result = cached
+            self.log(f"✓ Reusing cached TripoSR output ({cache_key[:12]})")
+            # Nothing was saved or masked for this request
+            shutil.rmtree(self.img_dir.parent, ignore_errors=True)
+            return {
+                "success": True,
+                "cached": True,
+                "work_directory": str(self.work_dir),
+                "image_directory": None,
+                "masked_directory": None,
+                "output_directory": str(self.output_dir),
+                "background_removal": cached_bg_result,
+                "triposr": cached_result,
+            }
+
         saved = self.save_images(image_data)
+        if not saved:
+            return {"success": False, "error": "No supported images provided (expected JPEG, PNG, WebP, HEIC or another format Pillow can read)"}
         masked, bg_result = self.remove_backgrounds(photoroom_api_key, saved)
 
         triposr_result = self.run_triposr(masked)
 
+        # Only cache complete runs; a partial background removal should be retried next time
+        if triposr_result.get("success") and (bg_result is None or bg_result.get("success")):
+            self._store_cached(cache_key, triposr_result, bg_result)
+
         return {
             "success": triposr_result.get("success", False),
+            "cached": False,
             "work_directory": str(self.work_dir),
             "image_directory": str(self.img_dir),
             "masked_directory": str(self.masked_dir) if masked != saved else None,
@@ -184,4 +523,126 @@ class TripoSRPipeline:
             "triposr": triposr_result,
         }
 
+    @staticmethod
+    def _cache_key(image_data: List[bytes], remove_background: bool) -> str:
+        """Hash the inputs and everything that changes the output for them."""
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{CACHE_VERSION}|bg={int(remove_background)}|{MAX_IMAGE_SIZE}".encode())
+        for data in image_data:
+            h.update(len(data).to_bytes(8, "little"))
+            h.update(data)
+        return h.hexdigest()
 
+    def _load_cached(self, key: str) -> Optional[Tuple[dict, Optional[dict]]]:
+        """
+        Link a cached result into a fresh run dir.
+
+        Returns the TripoSR result and the stored background removal summary, or None on a miss.
+        """
+        entry = self.cache_dir / key
+        if not entry.is_dir():
+            return None
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        run_dir = Path(tempfile.mkdtemp(prefix="cached_", dir=self.output_dir))
+        files: List[str] = []
+        try:
+            meta = json.loads((entry / CACHE_META).read_text())
+            # Link exactly what was published; a file missing to eviction raises and makes this a miss
+            for rel in meta["files"]:
+                src = entry / rel
+                dst = run_dir / rel
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                _link_or_copy(src, dst)
+                files.append(str(dst))
+            # Mark the entry as recently used for eviction
+            os.utime(entry)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # The entry was evicted while we were reading it (or is damaged); treat it as a miss
+            # and drop what is left so this run can publish a complete one
+            self.log(f"  Warning: Could not read cached TripoSR output: {e}")
+            shutil.rmtree(run_dir, ignore_errors=True)
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        if not files:
+            shutil.rmtree(run_dir, ignore_errors=True)
+            return None
+        triposr_result = {
+            "success": True,
+            "output_dir": str(run_dir),
+            "files": files,
+        }
+        return triposr_result, meta.get("background_removal")
+
+    def _store_cached(self, key: str, triposr_result: dict, bg_result: Optional[dict]) -> None:
+        """Link a run's outputs into the cache, publishing the entry with an atomic rename."""
+        entry = self.cache_dir / key
+        if entry.exists():
+            return
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix=f".{key}.", dir=self.cache_dir))
+        try:
+            run_dir = Path(triposr_result["output_dir"])
+            files: List[str] = []
+            size = 0
+            for file_str in triposr_result.get("files", []):
+                src = Path(file_str)
+                rel = src.relative_to(run_dir)
+                dst = tmp / rel
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                _link_or_copy(src, dst)
+                files.append(rel.as_posix())
+                size += dst.stat().st_size
+            # The masks themselves are not kept, so drop their (soon pruned) paths from the summary
+            if bg_result is not None:
+                bg_result = {k: v for k, v in bg_result.items() if k != "outputs"}
+            meta = {"files": files, "size": size, "background_removal": bg_result}
+            (tmp / CACHE_META).write_text(json.dumps(meta))
+            os.replace(tmp, entry)
+        except (OSError, ValueError) as e:
+            # Another request may have published the same entry first
+            self.log(f"  Warning: Could not cache TripoSR output: {e}")
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self._evict_cache()
+
+    def _prune(self) -> None:
+        """Bound what accumulates in a long-lived container across runs (the cache is bounded on store)."""
+        _prune_dirs(self.output_dir, ("triposr_", "cached_"), KEEP_RUNS)
+        _prune_dirs(self.inputs_dir, ("run_",), KEEP_RUNS)
+        # Scratch dirs left by a run that was killed mid-way
+        _prune_dirs(self.scratch_dir, ("triposr_",), 0)
+
+    def _evict_cache(self) -> None:
+        """Remove least recently used cache entries until the cache fits in CACHE_MAX_BYTES."""
+        try:
+            entries = [e for e in os.scandir(self.cache_dir) if e.is_dir(follow_symlinks=False)]
+        except FileNotFoundError:
+            return
+        sized = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                # In-progress store; only removed once old enough to have been abandoned by a killed run
+                try:
+                    if entry.stat().st_mtime < time.time() - RUN_DIR_MIN_AGE:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                except FileNotFoundError:
+                    pass
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            # Sizes come from the manifest, so eviction doesn't stat every cached file
+            try:
+                size = json.loads((Path(entry.path) / CACHE_META).read_text())["size"]
+            except (OSError, ValueError, KeyError):
+                size = _dir_size(Path(entry.path))
+            sized.append((mtime, size, entry.path))
+        total = sum(size for _, size, _ in sized)
+        for _, size, path in sorted(sized):
+            if total <= CACHE_MAX_BYTES:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size